@@ -0,0 +1,93 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from detector.models import DetectionResult
+from detector.utils import feature_store, ml_model
+from detector.management.commands.score_corpus import init_worker
+
+
+def vectorize_chunk(texts):
+    """Preprocess and vectorize one chunk of texts inside a worker process"""
+    return ml_model.transform_texts(texts)
+
+
+def missing_rows(stored, batch_size):
+    """
+    (id, input_text) for results whose features are not stored, in id order
+    Ids are checked against the sorted stored array a batch at a time, and
+    input_text is only read for the rows that are missing.
+    """
+    last_id = 0
+    while True:
+        ids = np.fromiter(
+            DetectionResult.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', flat=True)[:batch_size],
+            dtype=np.int64,
+        )
+        if not len(ids):
+            return
+        last_id = int(ids[-1])
+
+        if len(stored):
+            positions = np.minimum(np.searchsorted(stored, ids), len(stored) - 1)
+            ids = ids[stored[positions] != ids]
+        if not len(ids):
+            continue
+
+        texts = dict(DetectionResult.objects.filter(id__in=ids.tolist()).values_list('id', 'input_text'))
+        for result_id in ids.tolist():
+            # Skip rows deleted since their id was read
+            if result_id in texts:
+                yield result_id, texts[result_id]
+
+
+class Command(BaseCommand):
+    help = 'Store TF-IDF features for DetectionResult rows that are not in the feature store yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--no-compact', action='store_true',
+                            help='Leave the new segments unmerged')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = max(1, options['workers'])
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        self.stdout.write(f"Feature store: {feature_store.store_dir()}")
+        rows = missing_rows(feature_store.stored_ids(), chunk_size)
+
+        start_time = time.time()
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            # Only keep a bounded number of chunks in flight so memory stays flat
+            pending = deque()
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if chunk:
+                    ids = [result_id for result_id, _ in chunk]
+                    texts = [text for _, text in chunk]
+                    pending.append((ids, executor.submit(vectorize_chunk, texts)))
+                if pending and (not chunk or len(pending) >= workers * 2):
+                    ids, future = pending.popleft()
+                    feature_store.save_features(ids, future.result())
+                    done += len(ids)
+                    elapsed = time.time() - start_time
+                    rate = done / elapsed if elapsed > 0 else 0
+                    self.stdout.write(f"{done} rows stored ({rate:.0f} rows/sec)")
+                if not chunk and not pending:
+                    break
+
+        if done and not options['no_compact']:
+            self.stdout.write("Compacting segments...")
+            feature_store.compact()
+
+        self.stdout.write(self.style.SUCCESS(f"Finished: {done} rows stored"))
@@ -0,0 +1,64 @@
+import os
+import time
+import shutil
+import tempfile
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from detector.utils.shared_cache import SQLiteCache
+
+
+def sample_trending(count=10):
+    """A value shaped like news_api.get_trending_news() output"""
+    return [{
+        'id': i + 1,
+        'title': f"Sample headline number {i + 1} about current events",
+        'description': "A short description of the article. " * 5,
+        'url': f"https://example.com/news/{i + 1}",
+        'source': 'Example News',
+        'published_at': '2024-01-01T00:00:00Z',
+    } for i in range(count)]
+
+
+def time_calls(func, iterations):
+    """Return the mean latency of func in microseconds"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+class Command(BaseCommand):
+    help = 'Compare get/set latency of the shared cache with LocMemCache and FileBasedCache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--keys', type=int, default=100)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        key_count = options['keys']
+        value = sample_trending()
+        params = {'TIMEOUT': 300, 'OPTIONS': {'MAX_ENTRIES': key_count * 10}}
+
+        workdir = tempfile.mkdtemp()
+        try:
+            backends = [
+                ('LocMemCache', LocMemCache('benchmark', params)),
+                ('FileBasedCache', FileBasedCache(os.path.join(workdir, 'files'), params)),
+                ('SQLiteCache', SQLiteCache(os.path.join(workdir, 'cache.sqlite3'), params)),
+            ]
+
+            self.stdout.write(f"{'backend':<16}{'set (us)':>12}{'get hit (us)':>14}{'get miss (us)':>15}")
+            for name, backend in backends:
+                set_us = time_calls(
+                    lambda i: backend.set(f"key{i % key_count}", value), iterations)
+                hit_us = time_calls(
+                    lambda i: backend.get(f"key{i % key_count}"), iterations)
+                miss_us = time_calls(
+                    lambda i: backend.get(f"missing{i}"), iterations)
+                self.stdout.write(f"{name:<16}{set_us:>12.1f}{hit_us:>14.1f}{miss_us:>15.1f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,194 @@
+import os
+import time
+import shutil
+import random
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from detector.models import DetectionResult, DetectionRollup
+from detector.utils import history
+
+ALIAS = 'history_benchmark'
+DOMAINS = [f"news{i}.example.com" for i in range(50)]
+
+
+def add_database(path):
+    """Register a throwaway SQLite database so the real one is never touched"""
+    databases = connections.configure_settings({
+        'default': dict(connections.settings['default']),
+        ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path},
+    })
+    connections.settings[ALIAS] = databases[ALIAS]
+
+
+def plan_problems(plan):
+    """
+    Lines of an SQLite query plan that would not scale: a full table scan
+    without an index, or a temporary b-tree to sort the results
+    """
+    problems = []
+    for line in plan.splitlines():
+        if 'TEMP B-TREE' in line:
+            problems.append(line.strip())
+        elif 'SCAN' in line and 'INDEX' not in line and 'PRIMARY KEY' not in line:
+            problems.append(line.strip())
+    return problems
+
+
+def time_query(func, repeat):
+    """Median latency of func in milliseconds"""
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = 'Check query plans and time the history API queries on a synthetic detections table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--text-size', type=int, default=256,
+                            help='Characters of input_text per row')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--path', help='Database file to build (kept afterwards)')
+
+    def handle(self, *args, **options):
+        workdir = None if options['path'] else tempfile.mkdtemp()
+        path = options['path'] or os.path.join(workdir, 'history_benchmark.sqlite3')
+        if os.path.exists(path):
+            raise CommandError(f"{path} already exists")
+        add_database(path)
+
+        try:
+            self.build(options['rows'], options['days'], options['text_size'])
+            failed = self.check_plans()
+            self.time_queries(options['repeat'])
+        finally:
+            connections[ALIAS].close()
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        if failed:
+            raise CommandError(f"{failed} query plans do not use an index")
+
+    def build(self, rows, days, text_size):
+        call_command('migrate', database=ALIAS, verbosity=0)
+        connection = connections[ALIAS]
+        result_table = DetectionResult._meta.db_table
+        rollup_table = DetectionRollup._meta.db_table
+
+        self.stdout.write(f"Inserting {rows} rows...")
+        start_time = time.time()
+        rng = random.Random(42)
+        text = ('lorem ipsum dolor sit amet ' * (text_size // 27 + 1))[:text_size]
+        first = datetime(2024, 1, 1)
+        step = days * 86400 / max(rows, 1)
+
+        # Indexes are built once at the end rather than maintained per row
+        with connection.schema_editor() as editor:
+            for index in DetectionResult._meta.indexes:
+                editor.remove_index(DetectionResult, index)
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=OFF')
+            cursor.execute('PRAGMA synchronous=OFF')
+            batch = 50000
+            for offset in range(0, rows, batch):
+                values = []
+                for i in range(offset, min(offset + batch, rows)):
+                    domain = rng.choice(DOMAINS) if rng.random() < 0.7 else ''
+                    is_fake = rng.random() < 0.4
+                    values.append((
+                        text,
+                        f"https://{domain}/article/{i}" if domain else None,
+                        domain,
+                        is_fake,
+                        rng.random(),
+                        is_fake,
+                        None,
+                        (first + timedelta(seconds=i * step)).strftime('%Y-%m-%d %H:%M:%S.%f'),
+                    ))
+                with transaction.atomic(using=ALIAS):
+                    cursor.executemany(
+                        f'INSERT INTO {result_table} (input_text, input_url, input_domain, is_fake, '
+                        'confidence_score, ml_prediction, openai_prediction, created_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        values
+                    )
+            # Same totals the incremental counters would have reached
+            cursor.execute(
+                f"INSERT INTO {rollup_table} (hour, total, fake) "
+                f"SELECT substr(created_at, 1, 13) || ':00:00', COUNT(*), SUM(is_fake) "
+                f"FROM {result_table} GROUP BY 1"
+            )
+
+        with connection.schema_editor() as editor:
+            for index in DetectionResult._meta.indexes:
+                editor.add_index(DetectionResult, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(f"Built in {time.time() - start_time:.0f}s")
+
+    def queries(self):
+        """The history API's queries, with a cursor from the middle of the table"""
+        middle = history.history_queryset(using=ALIAS)[
+            DetectionResult.objects.using(ALIAS).count() // 2
+        ]
+        cursor = history.encode_cursor(middle['created_at'], middle['id'])
+        end = DetectionRollup.objects.using(ALIAS).order_by('-hour').values_list('hour', flat=True)[0]
+        return [
+            ('first page', lambda: history.history_queryset(using=ALIAS)[:50]),
+            ('middle page', lambda: history.history_queryset(cursor, using=ALIAS)[:50]),
+            ('fake only, middle page',
+             lambda: history.history_queryset(cursor, is_fake=True, using=ALIAS)[:50]),
+            ('one domain, first page',
+             lambda: history.history_queryset(domain=DOMAINS[7], using=ALIAS)[:50]),
+            ('one domain, middle page',
+             lambda: history.history_queryset(cursor, domain=DOMAINS[7], using=ALIAS)[:50]),
+            ('30 day hourly stats',
+             lambda: DetectionRollup.objects.using(ALIAS).filter(
+                 hour__gte=end - timedelta(days=30), hour__lte=end).order_by('hour')),
+        ], end
+
+    def check_plans(self):
+        self.stdout.write("\nQuery plans:")
+        failed = 0
+        queries, _ = self.queries()
+        for name, build_query in queries:
+            plan = build_query().explain()
+            problems = plan_problems(plan)
+            status = self.style.ERROR('FAIL') if problems else self.style.SUCCESS('OK')
+            self.stdout.write(f"  [{status}] {name}")
+            for line in plan.splitlines():
+                self.stdout.write(f"         {line.strip()}")
+            failed += bool(problems)
+        return failed
+
+    def time_queries(self, repeat):
+        self.stdout.write("\nMedian latency:")
+        queries, end = self.queries()
+        for name, build_query in queries:
+            ms = time_query(lambda: list(build_query()), repeat)
+            self.stdout.write(f"  {name:<28}{ms:>10.2f} ms")
+
+        # Walking pages keeps a constant cost per page, unlike OFFSET
+        rows, cursor = history.get_history_page(limit=50, using=ALIAS)
+        start = time.perf_counter()
+        for _ in range(100):
+            rows, cursor = history.get_history_page(limit=50, cursor=cursor, using=ALIAS)
+        self.stdout.write(f"  {'100 consecutive pages':<28}{(time.perf_counter() - start) * 1000:>10.2f} ms")
+
+        stats_ms = time_query(lambda: history.get_hourly_stats(
+            start=end - timedelta(days=30), end=end, using=ALIAS), repeat)
+        self.stdout.write(f"  {'get_hourly_stats (30 days)':<28}{stats_ms:>10.2f} ms")
@@ -0,0 +1,58 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from detector.models import DetectionResult
+from detector.utils import feature_store, ml_model
+
+
+class Command(BaseCommand):
+    help = 'Re-score stored DetectionResult features with the current model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='CSV or JSONL file to write results to')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        output_path = options['output']
+        is_jsonl = output_path.endswith('.jsonl') or output_path.endswith('.json')
+        if ml_model.model is None or ml_model.vectorizer is None:
+            ml_model.init_model()
+
+        start_time = time.time()
+        done = changed = 0
+        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+            writer = None
+            if not is_jsonl:
+                writer = csv.DictWriter(f, fieldnames=['id', 'is_fake', 'confidence', 'changed'])
+                writer.writeheader()
+
+            # Features come straight from the store, so no text is preprocessed again
+            for ids, X in feature_store.iter_features(options['chunk_size']):
+                previous = dict(
+                    DetectionResult.objects.filter(id__in=ids.tolist()).values_list('id', 'ml_prediction')
+                )
+                for result_id, (is_fake, confidence) in zip(ids.tolist(), ml_model.predict_matrix(X)):
+                    if result_id not in previous:
+                        continue
+                    row = {
+                        'id': result_id,
+                        'is_fake': is_fake,
+                        'confidence': round(confidence, 6),
+                        'changed': is_fake != previous[result_id],
+                    }
+                    changed += row['changed']
+                    if is_jsonl:
+                        f.write(json.dumps(row) + '\n')
+                    else:
+                        writer.writerow(row)
+                done += len(ids)
+                elapsed = time.time() - start_time
+                rate = done / elapsed if elapsed > 0 else 0
+                self.stdout.write(f"{done} rows scored ({rate:.0f} rows/sec)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished: {done} rows scored, {changed} verdicts changed"
+        ))
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('input_text', models.TextField()),
+                ('input_url', models.URLField(blank=True, null=True)),
+                ('is_fake', models.BooleanField()),
+                ('confidence_score', models.FloatField()),
+                ('ml_prediction', models.BooleanField()),
+                ('openai_prediction', models.BooleanField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:25
+
+from datetime import timezone
+from urllib.parse import urlparse
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+
+
+def url_domain(url):
+    """
+    Copy of detector.models.url_domain as it was when this migration was
+    written, so replaying the migration never depends on live app code
+    """
+    if not url:
+        return ''
+    host = urlparse(url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+
+def backfill_history(apps, schema_editor):
+    """
+    Fill in input_domain for existing results and rebuild the hourly
+    rollups from them, so the history API covers rows saved before it existed
+    """
+    DetectionResult = apps.get_model('detector', 'DetectionResult')
+    DetectionRollup = apps.get_model('detector', 'DetectionRollup')
+    db = schema_editor.connection.alias
+    results = DetectionResult.objects.using(db)
+
+    # Walk the table in id order so memory stays flat on large tables
+    last_id = 0
+    batch = 2000
+    while True:
+        rows = list(
+            results.filter(id__gt=last_id, input_url__isnull=False)
+            .exclude(input_url='').order_by('id').only('id', 'input_url')[:batch]
+        )
+        if not rows:
+            break
+        for row in rows:
+            row.input_domain = url_domain(row.input_url)
+        results.bulk_update(rows, ['input_domain'])
+        last_id = rows[-1].id
+
+    # One GROUP BY over the table; hours are in UTC like DetectionRollup.record
+    hourly = (
+        results.annotate(bucket=TruncHour('created_at', tzinfo=timezone.utc))
+        .values('bucket')
+        .annotate(total=Count('id'), fake=Count('id', filter=Q(is_fake=True)))
+        .order_by('bucket')
+    )
+    rollups = DetectionRollup.objects.using(db)
+    rollups.all().delete()
+    rollups.bulk_create(
+        [DetectionRollup(hour=row['bucket'], total=row['total'], fake=row['fake']) for row in hourly],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detector', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(unique=True)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('fake', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='detectionresult',
+            name='input_domain',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        # Backfill before the indexes exist so the updates do not have to maintain them
+        migrations.RunPython(backfill_history, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='detectionresult',
+            index=models.Index(fields=['created_at', 'id'], name='detection_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionresult',
+            index=models.Index(fields=['is_fake', 'created_at', 'id'], name='detection_fake_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionresult',
+            index=models.Index(fields=['input_domain', 'created_at', 'id'], name='detection_domain_created_idx'),
+        ),
+    ]
@@ -1,4 +1,13 @@
-from django.db import models
+from urllib.parse import urlparse
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+
+def url_domain(url):
+    """Host part of a URL without a leading 'www.', used for domain filters"""
+    if not url:
+        return ''
+    host = urlparse(url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
 
 # Create your models here.
 class DetectionResult(models.Model):
@@ -7,11 +16,61 @@ class DetectionResult(models.Model):
     """
     input_text = models.TextField()
     input_url = models.URLField(blank=True, null=True)
+    input_domain = models.CharField(max_length=255, blank=True, default='')
     is_fake = models.BooleanField()
     confidence_score = models.FloatField()
     ml_prediction = models.BooleanField()
     openai_prediction = models.BooleanField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
+    class Meta:
+        # Support keyset pagination on (created_at, id), optionally filtered
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='detection_created_idx'),
+            models.Index(fields=['is_fake', 'created_at', 'id'], name='detection_fake_created_idx'),
+            models.Index(fields=['input_domain', 'created_at', 'id'], name='detection_domain_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        self.input_domain = url_domain(self.input_url)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if adding:
+                DetectionRollup.record([self], using=kwargs.get('using'))
+
     def __str__(self):
         return f"{'Fake' if self.is_fake else 'Real'} news with {self.confidence_score*100:.1f}% confidence"
+
+class DetectionRollup(models.Model):
+    """
+    Hourly detection counters, updated as results are inserted so
+    time-series queries never have to scan DetectionResult
+    """
+    hour = models.DateTimeField(unique=True)
+    total = models.PositiveIntegerField(default=0)
+    fake = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def record(cls, results, using=None):
+        """Add newly inserted results to their hourly counters"""
+        counts = {}
+        for result in results:
+            hour = result.created_at.replace(minute=0, second=0, microsecond=0)
+            total, fake = counts.get(hour, (0, 0))
+            counts[hour] = (total + 1, fake + int(bool(result.is_fake)))
+
+        manager = cls.objects.db_manager(using)
+        for hour, (total, fake) in counts.items():
+            updated = manager.filter(hour=hour).update(total=F('total') + total, fake=F('fake') + fake)
+            if updated:
+                continue
+            try:
+                with transaction.atomic(using=manager.db):
+                    manager.create(hour=hour, total=total, fake=fake)
+            except IntegrityError:
+                # Another worker created this hour first
+                manager.filter(hour=hour).update(total=F('total') + total, fake=F('fake') + fake)
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00}: {self.fake}/{self.total} fake"
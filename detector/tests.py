@@ -0,0 +1,672 @@
+import os
+import io
+import importlib
+import csv
+import json
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import numpy as np
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import TfidfVectorizer
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.apps import apps
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from .models import DetectionResult, DetectionRollup
+from .utils import ml_model, feature_store, history, admission
+from .utils.shared_cache import SQLiteCache
+
+
+def increment_shared_counter(path, times):
+    """Runs in a child process: bump a counter in the cache at path"""
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+def hold_slot(stage, ready, done):
+    """Runs in a child process: take a slot, then exit without releasing it"""
+    admission.acquire(stage)
+    ready.set()
+    done.wait(10)
+    os._exit(0)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def meta(self, cache):
+        conn = cache._connection()
+        stored = conn.execute('SELECT count, size FROM cache_meta').fetchone()
+        actual = conn.execute('SELECT COUNT(*), TOTAL(size) FROM cache').fetchone()
+        return stored, actual
+
+    def test_values_round_trip(self):
+        cache = self.make_cache()
+        value = {'articles': ['x' * 5000, 'y'], 'count': 2}
+        cache.set('trending', value)
+        self.assertEqual(cache.get('trending'), value)
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.get_many(['trending', 'missing']), {'trending': value})
+
+    def test_entries_expire(self):
+        cache = self.make_cache()
+        with mock.patch('detector.utils.shared_cache.time.time', return_value=1000.0):
+            cache.set('short', 'value', timeout=10)
+            cache.set('forever', 'value', timeout=None)
+        with mock.patch('detector.utils.shared_cache.time.time', return_value=1005.0):
+            self.assertEqual(cache.get('short'), 'value')
+        with mock.patch('detector.utils.shared_cache.time.time', return_value=1011.0):
+            self.assertIsNone(cache.get('short'))
+            self.assertFalse(cache.has_key('short'))
+            self.assertTrue(cache.add('short', 'again'))
+            self.assertEqual(cache.get('forever'), 'value')
+
+    def test_evicts_oldest_beyond_max_entries(self):
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        for i in range(30):
+            cache.set(f'key{i}', i)
+        stored, actual = self.meta(cache)
+        self.assertLessEqual(actual[0], 11)
+        self.assertEqual(cache.get('key29'), 29)
+        self.assertIsNone(cache.get('key0'))
+        self.assertEqual(stored, actual)
+
+    def test_evicts_oldest_beyond_max_size(self):
+        cache = self.make_cache(MAX_SIZE=10000)
+        for i in range(50):
+            cache.set(f'key{i}', os.urandom(900))
+        stored, actual = self.meta(cache)
+        self.assertLessEqual(actual[1], 10000)
+        self.assertIsNotNone(cache.get('key49'))
+        self.assertIsNone(cache.get('key0'))
+        self.assertEqual(stored, actual)
+
+    def test_oversized_value_is_not_stored(self):
+        cache = self.make_cache(MAX_SIZE=10000)
+        cache.set('small', 'kept')
+        cache.set('big', 'old')
+        cache.set('big', os.urandom(20000))
+        self.assertIsNone(cache.get('big'))
+        self.assertEqual(cache.get('small'), 'kept')
+        self.assertFalse(cache.add('huge', os.urandom(20000)))
+        self.assertEqual(cache.set_many({'ok': 1, 'huge': os.urandom(20000)}), ['huge'])
+        self.assertEqual(cache.get('ok'), 1)
+
+    def test_meta_tracks_replace_update_and_delete(self):
+        cache = self.make_cache()
+        cache.set('a', 'x' * 100)
+        cache.set('a', 'x' * 300)
+        cache.set('n', 1)
+        cache.incr('n', 10 ** 30)
+        cache.delete('a')
+        stored, actual = self.meta(cache)
+        self.assertEqual(stored, actual)
+        cache.clear()
+        self.assertEqual(self.meta(cache)[0], (0, 0))
+
+    def test_incr_is_atomic_across_processes(self):
+        cache = self.make_cache()
+        cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=increment_shared_counter, args=(self.path, 100))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(cache.get('counter'), 400)
+
+
+class ForestAttributionTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        words = [f"word{i}" for i in range(60)]
+        texts = [' '.join(rng.choice(words, size=12)) for _ in range(200)]
+        labels = [int('word1 ' in text or 'word2 ' in text) for text in texts]
+
+        vectorizer = TfidfVectorizer()
+        self.X = vectorizer.fit_transform(texts)
+        forest = RandomForestClassifier(n_estimators=15, max_depth=6, random_state=0).fit(self.X, labels)
+
+        # Swap in the small forest, then restore the loaded model afterwards
+        patcher = mock.patch.multiple(
+            ml_model, model=forest, vectorizer=vectorizer,
+            node_deltas=[], base_value=0.0, feature_names=None,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ml_model.build_attribution()
+
+    def test_contributions_add_up_to_predicted_probability(self):
+        contributions, complete = ml_model.attribute_matrix(self.X)
+        self.assertTrue(complete)
+        fake_index = list(ml_model.model.classes_).index(1)
+        expected = ml_model.model.predict_proba(self.X)[:, fake_index]
+        totals = np.asarray(contributions.sum(axis=1)).ravel() + ml_model.base_value
+        np.testing.assert_allclose(totals, expected, atol=1e-9)
+
+    def test_batch_explanations_have_no_budget_by_default(self):
+        with override_settings(ML_EXPLANATION_BUDGET_MS=0):
+            explanations, complete = ml_model.explain_matrix(self.X, return_complete=True)
+        self.assertTrue(complete)
+        self.assertEqual(len(explanations), self.X.shape[0])
+
+    def test_spent_budget_is_reported(self):
+        _, complete = ml_model.explain_matrix(self.X, budget_ms=0, return_complete=True)
+        self.assertFalse(complete)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@mock.patch('detector.utils.news_api.get_trending_news', mock.Mock(return_value=[]))
+class ExplanationCacheTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        override = override_settings(FEATURE_STORE_PATH=self.dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.result = DetectionResult.objects.create(
+            input_text='shocking news', is_fake=True, confidence_score=0.9, ml_prediction=True,
+        )
+        self.url = reverse('detector:results', args=[self.result.id])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_explanations_are_cached_per_model(self):
+        with mock.patch.object(ml_model, 'get_explanation', return_value=([('shocking', 12.0)], True)) as explain:
+            self.client.get(self.url)
+            response = self.client.get(self.url)
+            self.assertEqual(explain.call_count, 1)
+            self.assertEqual(response.context['explanation'], [('shocking', 12.0)])
+
+            # A retrained model gets its own cache entries
+            with mock.patch.object(ml_model, 'model_version', 'retrained'):
+                self.client.get(self.url)
+            self.assertEqual(explain.call_count, 2)
+
+
+class FeatureStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        override = override_settings(FEATURE_STORE_PATH=self.dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        if ml_model.vectorizer is None:
+            ml_model.init_model()
+        self.n_features = len(ml_model.vectorizer.vocabulary_)
+
+    def tearDown(self):
+        feature_store._segments.clear()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def random_rows(self, count, seed):
+        return sparse.random(count, self.n_features, density=0.3, format='csr',
+                             dtype=np.float32, random_state=seed)
+
+    def segment_names(self):
+        return sorted(os.listdir(feature_store.store_dir()))
+
+    def test_save_and_load_round_trip(self):
+        X = self.random_rows(5, seed=1)
+        feature_store.save_features([50, 10, 40, 20, 30], X)
+        loaded, found = feature_store.load_features([30, 99, 50])
+        self.assertEqual(found.tolist(), [True, False, True])
+        np.testing.assert_array_equal(loaded[0].toarray(), X[4].toarray())
+        self.assertEqual(loaded[1].nnz, 0)
+        np.testing.assert_array_equal(loaded[2].toarray(), X[0].toarray())
+        self.assertEqual(feature_store.stored_ids().tolist(), [10, 20, 30, 40, 50])
+
+    def test_newer_segment_wins(self):
+        feature_store.save_features([1, 2], self.random_rows(2, seed=1))
+        newer = self.random_rows(1, seed=2)
+        feature_store.save_features([2], newer)
+        loaded, _ = feature_store.load_features([2])
+        np.testing.assert_array_equal(loaded.toarray(), newer.toarray())
+
+    def test_compact_keeps_latest_rows(self):
+        first = self.random_rows(3, seed=1)
+        second = self.random_rows(2, seed=2)
+        feature_store.save_features([1, 2, 3], first)
+        feature_store.save_features([3, 4], second)
+        expected, _ = feature_store.load_features([1, 2, 3, 4])
+
+        feature_store.compact()
+        self.assertEqual(len(feature_store._segment_paths()), 1)
+        loaded, found = feature_store.load_features([1, 2, 3, 4])
+        self.assertTrue(found.all())
+        np.testing.assert_array_equal(loaded.toarray(), expected.toarray())
+        streamed = list(feature_store.iter_features())
+        self.assertEqual(streamed[0][0].tolist(), [1, 2, 3, 4])
+
+    def test_leftover_staging_is_ignored_and_removed(self):
+        feature_store.save_features([1, 2], self.random_rows(2, seed=1))
+        # A writer that died after writing only ids.npy, and one still writing
+        dead = os.path.join(feature_store.store_dir(), 'seg-00000000000000000001-1.99999999.tmp')
+        live = os.path.join(feature_store.store_dir(), f'seg-00000000000000000002-1.{os.getpid()}.tmp')
+        for path in (dead, live):
+            os.makedirs(path)
+            np.save(os.path.join(path, 'ids.npy'), np.array([3], dtype=np.int64))
+
+        self.assertEqual(feature_store.stored_ids().tolist(), [1, 2])
+        _, found = feature_store.load_features([1, 3])
+        self.assertEqual(found.tolist(), [True, False])
+        self.assertEqual(sum(len(ids) for ids, _ in feature_store.iter_features()), 2)
+
+        feature_store.save_features([3], self.random_rows(1, seed=2))
+        feature_store.compact()
+        names = self.segment_names()
+        self.assertNotIn(os.path.basename(dead), names)
+        self.assertIn(os.path.basename(live), names)
+        self.assertEqual(feature_store.stored_ids().tolist(), [1, 2, 3])
+
+    def test_truncated_segment_is_skipped(self):
+        feature_store.save_features([1], self.random_rows(1, seed=1))
+        broken = os.path.join(feature_store.store_dir(), 'seg-99999999999999999999-1')
+        os.makedirs(broken)
+        for name in ('ids', 'indptr', 'indices', 'data'):
+            with open(os.path.join(broken, f'{name}.npy'), 'wb') as f:
+                f.write(b'\x93NUMPY')
+        _, found = feature_store.load_features([1, 2])
+        self.assertEqual(found.tolist(), [True, False])
+        self.assertEqual(feature_store.stored_ids().tolist(), [1])
+
+    def test_small_segments_are_merged(self):
+        X = self.random_rows(6, seed=1)
+        with mock.patch.object(feature_store, 'MAX_SMALL_SEGMENTS', 4):
+            for i in range(6):
+                feature_store.save_features([i], X[i])
+        self.assertEqual(len(feature_store._segment_paths()), 3)
+        loaded, found = feature_store.load_features(list(range(6)))
+        self.assertTrue(found.all())
+        np.testing.assert_array_equal(loaded.toarray(), X.toarray())
+
+
+class HistoryPaginationTests(TestCase):
+    def setUp(self):
+        # Rows share timestamps in groups, so the cursor has to break ties on id
+        first = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        for i in range(23):
+            result = DetectionResult.objects.create(
+                input_text=f"article {i}",
+                input_url=f"https://www.site{i % 2}.com/{i}",
+                is_fake=i % 3 == 0,
+                confidence_score=0.9,
+                ml_prediction=i % 3 == 0,
+            )
+            DetectionResult.objects.filter(id=result.id).update(created_at=first + timedelta(minutes=i // 5))
+
+    def walk(self, limit, **filters):
+        ids, cursor = [], None
+        while True:
+            rows, cursor = history.get_history_page(limit=limit, cursor=cursor, **filters)
+            ids.extend(row['id'] for row in rows)
+            if cursor is None:
+                return ids
+
+    def expected(self, queryset):
+        return list(queryset.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        for limit in (1, 4, 5, 7, 23, 50):
+            self.assertEqual(self.walk(limit), self.expected(DetectionResult.objects.all()))
+
+    def test_filtered_pages_have_no_duplicates_or_gaps(self):
+        self.assertEqual(
+            self.walk(3, is_fake=True),
+            self.expected(DetectionResult.objects.filter(is_fake=True)),
+        )
+        self.assertEqual(
+            self.walk(3, domain='www.site1.com'),
+            self.expected(DetectionResult.objects.filter(input_domain='site1.com')),
+        )
+
+    def test_invalid_cursor_is_rejected(self):
+        with self.assertRaises(ValueError):
+            history.get_history_page(cursor='not-a-cursor')
+
+
+@mock.patch('detector.utils.ml_model.preprocess_text', lambda text: text.lower())
+class ScoreCorpusTests(TestCase):
+    TEXTS = [
+        "shocking government conspiracy revealed",
+        "researchers at the university found evidence",
+        "miracle cure they don't want you to know about",
+        "multiple sources have verified the report",
+        "experts have confirmed the study",
+        "this secret will change everything you believe",
+        "according to recent scientific studies",
+        "the media won't tell you this shocking news",
+        "evidence suggests the policy worked",
+        "they don't want you to know this",
+    ]
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        override = override_settings(FEATURE_STORE_PATH=os.path.join(self.dir, 'features'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.input = os.path.join(self.dir, 'articles.csv')
+        with open(self.input, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['id', 'title', 'text', 'url'])
+            for i, text in enumerate(self.TEXTS):
+                writer.writerow([f"a{i}", '', text, f"https://www.site{i % 2}.com/{i}"])
+
+    def tearDown(self):
+        feature_store._segments.clear()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def score(self, *args):
+        call_command('score_corpus', self.input, '--workers', '1', '--chunk-size', '4',
+                     *args, stdout=io.StringIO())
+
+    def read(self, path):
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    def test_csv_output(self):
+        output = os.path.join(self.dir, 'scores.csv')
+        self.score('--output', output)
+        with open(output, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row['row'] for row in rows], [str(i) for i in range(len(self.TEXTS))])
+        self.assertEqual(rows[3]['id'], 'a3')
+        self.assertEqual(set(rows[0]), {'row', 'id', 'is_fake', 'confidence'})
+        expected = ml_model.predict_batch(self.TEXTS)
+        self.assertEqual([row['is_fake'] == 'True' for row in rows], [fake for fake, _ in expected])
+
+    def test_jsonl_output_with_explanations(self):
+        output = os.path.join(self.dir, 'scores.jsonl')
+        self.score('--output', output, '--explain')
+        rows = [json.loads(line) for line in self.read(output).splitlines()]
+        self.assertEqual(len(rows), len(self.TEXTS))
+        self.assertIsInstance(rows[0]['is_fake'], bool)
+        for word, value in rows[0]['explanation']:
+            self.assertIsInstance(word, str)
+            self.assertIsInstance(value, float)
+
+    def test_resume_truncates_and_matches_a_full_run(self):
+        for name in ('scores.csv', 'scores.jsonl'):
+            output = os.path.join(self.dir, name)
+            self.score('--output', output)
+            full = self.read(output)
+
+            # Pretend the run died after the first chunk, mid-way through writing the second
+            lines = full.splitlines(keepends=True)
+            header = 0 if name.endswith('.jsonl') else 1
+            done = ''.join(lines[:header + 4])
+            with open(output, 'w', newline='', encoding='utf-8') as f:
+                f.write(done + lines[header + 4][:5])
+            with open(f"{output}.progress", 'w') as f:
+                json.dump({'rows_done': 4, 'output_offset': len(done.encode('utf-8')),
+                           'explain': False}, f)
+
+            self.score('--output', output, '--resume')
+            self.assertEqual(self.read(output), full)
+
+    def test_resume_keeps_the_explain_setting(self):
+        output = os.path.join(self.dir, 'scores.csv')
+        with open(f"{output}.progress", 'w') as f:
+            json.dump({'rows_done': 4, 'output_offset': 10, 'explain': False}, f)
+        with self.assertRaises(CommandError):
+            self.score('--output', output, '--resume', '--explain')
+
+    def test_save_results_counts_rows_and_rollups(self):
+        self.score('--save-results')
+        expected = ml_model.predict_batch(self.TEXTS)
+        fake = sum(is_fake for is_fake, _ in expected)
+        self.assertEqual(DetectionResult.objects.count(), len(self.TEXTS))
+        self.assertEqual(DetectionResult.objects.filter(is_fake=True).count(), fake)
+        self.assertEqual(DetectionResult.objects.filter(input_domain='site1.com').count(), 5)
+        rollups = DetectionRollup.objects.all()
+        self.assertEqual(sum(rollup.total for rollup in rollups), len(self.TEXTS))
+        self.assertEqual(sum(rollup.fake for rollup in rollups), fake)
+        ids = sorted(DetectionResult.objects.values_list('id', flat=True))
+        self.assertEqual(feature_store.stored_ids().tolist(), ids)
+
+    def test_save_results_resume_skips_saved_chunks(self):
+        checkpoint = os.path.join(self.dir, 'progress.json')
+        with open(checkpoint, 'w') as f:
+            json.dump({'rows_done': 8, 'output_offset': 0, 'explain': False}, f)
+        self.score('--save-results', '--checkpoint', checkpoint, '--resume')
+        self.assertEqual(DetectionResult.objects.count(), 2)
+        self.assertEqual(sum(DetectionRollup.objects.values_list('total', flat=True)), 2)
+
+
+ADMISSION_TEST_LIMITS = {
+    'scrape': {'concurrency': 1, 'queue': 1, 'timeout': 0.3, 'retry_after': 11},
+    'openai': {'concurrency': 1, 'queue': 0, 'timeout': 0.3, 'retry_after': 12},
+    'ml': {'concurrency': 1, 'queue': 1, 'timeout': 0.3, 'retry_after': 7},
+}
+
+
+class AdmissionTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        override = override_settings(ADMISSION_DIR=self.dir, ADMISSION_LIMITS=ADMISSION_TEST_LIMITS)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_saturated_stage_queues_then_sheds(self):
+        token = admission.acquire('ml')
+        queued = []
+        waiter = threading.Thread(target=lambda: queued.append(admission.acquire('ml')))
+        waiter.start()
+        self.wait_for(lambda: admission.get_stats()['ml']['queued'] == 1)
+
+        # The only slot and the only queue place are taken, so this is shed at once
+        with self.assertRaises(admission.StageBusy) as busy:
+            admission.acquire('ml')
+        self.assertEqual(busy.exception.retry_after, 7)
+
+        admission.release(token)
+        waiter.join()
+        self.assertEqual(len(queued), 1)
+        stats = admission.get_stats()['ml']
+        self.assertEqual((stats['in_flight'], stats['queued']), (1, 0))
+        self.assertEqual((stats['admitted'], stats['shed']), (2, 1))
+        admission.release(queued[0])
+        self.assertEqual(admission.get_stats()['ml']['in_flight'], 0)
+
+    def test_queued_request_is_shed_after_timeout(self):
+        with admission.admit('ml'):
+            start = time.monotonic()
+            with self.assertRaises(admission.StageBusy):
+                admission.acquire('ml')
+            self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        stats = admission.get_stats()['ml']
+        self.assertEqual((stats['queued'], stats['shed']), (0, 1))
+        admission.release(admission.acquire('ml'))
+
+    def test_gauges_cover_other_processes_and_drop_dead_ones(self):
+        context = multiprocessing.get_context('fork')
+        ready, done = context.Event(), context.Event()
+        child = context.Process(target=hold_slot, args=('ml', ready, done))
+        child.start()
+        try:
+            self.assertTrue(ready.wait(5))
+            self.assertEqual(admission.get_stats()['ml']['in_flight'], 1)
+            with self.assertRaises(admission.StageBusy):
+                admission.acquire('ml')
+        finally:
+            done.set()
+            child.join()
+
+        # The child died holding the slot; its lock and its gauge went with it
+        self.assertEqual(admission.get_stats()['ml']['in_flight'], 0)
+        admission.release(admission.acquire('ml'))
+
+    def test_corrupt_stats_file_does_not_leak_slots(self):
+        with open(os.path.join(self.dir, 'ml.stats'), 'w') as f:
+            f.write('{"admitted": 3, "gau')
+        for _ in range(3):
+            with admission.admit('ml'):
+                pass
+        stats = admission.get_stats()['ml']
+        self.assertEqual((stats['admitted'], stats['in_flight']), (3, 0))
+
+
+@mock.patch('detector.utils.ml_model.preprocess_text', lambda text: text.lower())
+class DetectAdmissionTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        override = override_settings(
+            ADMISSION_DIR=self.dir, ADMISSION_LIMITS=ADMISSION_TEST_LIMITS,
+            FEATURE_STORE_PATH=os.path.join(self.dir, 'features'), OPENAI_API_KEY='test',
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        feature_store._segments.clear()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_busy_ml_stage_returns_503(self):
+        # The request queues behind the held slot, then is shed once its wait runs out
+        with admission.admit('ml'):
+            response = self.client.post(reverse('detector:detect'), {'news_text': 'shocking news revealed'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertFalse(DetectionResult.objects.exists())
+
+    @mock.patch('detector.utils.openai_helper.analyze_text', return_value=(True, 0.99))
+    @mock.patch('detector.utils.web_scraper.get_website_text', return_value='experts have confirmed the study')
+    def test_busy_openai_stage_falls_back_to_ml(self, scrape, analyze):
+        with admission.admit('openai'):
+            response = self.client.post(reverse('detector:detect'), {'news_url': 'https://www.example.com/a'})
+        self.assertEqual(response.status_code, 200)
+        analyze.assert_not_called()
+        result = DetectionResult.objects.get(id=response.json()['result_id'])
+        self.assertIsNone(result.openai_prediction)
+        self.assertEqual(result.is_fake, result.ml_prediction)
+
+        # With the stage free again, OpenAI is consulted
+        response = self.client.post(reverse('detector:detect'), {'news_url': 'https://www.example.com/b'})
+        analyze.assert_called_once()
+        self.assertTrue(DetectionResult.objects.get(id=response.json()['result_id']).openai_prediction)
+
+
+@mock.patch('detector.utils.ml_model.preprocess_text', lambda text: text.lower())
+class BackfillFeaturesTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        override = override_settings(FEATURE_STORE_PATH=self.dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.ids = [
+            DetectionResult.objects.create(
+                input_text=f"article {i} about the study", is_fake=False,
+                confidence_score=0.9, ml_prediction=False,
+            ).id
+            for i in range(7)
+        ]
+
+    def tearDown(self):
+        feature_store._segments.clear()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_only_missing_rows_are_stored(self):
+        stored = ml_model.transform_texts(['already stored'] * 2)
+        feature_store.save_features([self.ids[1], self.ids[4]], stored)
+        call_command('backfill_features', '--workers', '1', '--chunk-size', '3', stdout=io.StringIO())
+
+        self.assertEqual(feature_store.stored_ids().tolist(), self.ids)
+        self.assertEqual(len(feature_store._segment_paths()), 1)
+        X, found = feature_store.load_features(self.ids)
+        self.assertTrue(found.all())
+        # Rows that were already stored are left alone
+        np.testing.assert_array_equal(X[1].toarray(), stored[0].toarray())
+        expected = ml_model.transform_texts([f"article {i} about the study" for i in (0, 2)])
+        np.testing.assert_allclose(X[[0, 2]].toarray(), expected.toarray(), rtol=1e-6)
+
+
+class HourlyStatsTests(TestCase):
+    def setUp(self):
+        self.hour = datetime(2024, 3, 1, 10, tzinfo=dt_timezone.utc)
+        # (minutes after 10:00, is_fake): three results at 10:xx, one at 11:xx
+        for minutes, is_fake, url in [(5, True, 'https://www.a.com/1'), (30, True, None),
+                                      (59, False, 'https://b.org/2'), (61, False, 'https://www.a.com/3')]:
+            self.create(self.hour + timedelta(minutes=minutes), is_fake, url)
+
+    def create(self, when, is_fake, url=None):
+        with mock.patch('django.utils.timezone.now', return_value=when):
+            return DetectionResult.objects.create(
+                input_text='article', input_url=url, is_fake=is_fake,
+                confidence_score=0.8, ml_prediction=is_fake,
+            )
+
+    def rollups(self):
+        return list(DetectionRollup.objects.order_by('hour').values_list('hour', 'total', 'fake'))
+
+    def test_save_updates_hourly_counters(self):
+        self.assertEqual(self.rollups(), [
+            (self.hour, 3, 2),
+            (self.hour + timedelta(hours=1), 1, 0),
+        ])
+        # Updating an existing result does not count it again
+        result = DetectionResult.objects.first()
+        result.save()
+        self.assertEqual(sum(total for _, total, _ in self.rollups()), 4)
+
+    def test_stats_endpoint_reports_totals_and_fake_rate(self):
+        with mock.patch('django.utils.timezone.now', return_value=self.hour + timedelta(hours=1, minutes=30)):
+            response = self.client.get(reverse('detector:detection_stats'), {'hours': 3})
+        stats = response.json()
+        self.assertEqual((stats['total'], stats['fake']), (4, 2))
+        self.assertEqual(stats['fake_rate'], 0.5)
+        self.assertEqual([(bucket['total'], bucket['fake']) for bucket in stats['hourly']], [(3, 2), (1, 0)])
+        self.assertAlmostEqual(stats['hourly'][0]['fake_rate'], 2 / 3)
+
+    def test_bucket_edges(self):
+        next_hour = self.hour + timedelta(hours=1)
+        # start is rounded down to its hour; end includes a bucket starting exactly at end
+        stats = history.get_hourly_stats(start=self.hour + timedelta(minutes=59), end=next_hour)
+        self.assertEqual(stats['total'], 4)
+        stats = history.get_hourly_stats(start=next_hour + timedelta(microseconds=1), end=next_hour + timedelta(hours=5))
+        self.assertEqual(stats['total'], 1)
+        stats = history.get_hourly_stats(start=self.hour, end=next_hour - timedelta(microseconds=1))
+        self.assertEqual((stats['total'], stats['fake']), (3, 2))
+
+    def test_migration_backfill_matches_per_insert_counters(self):
+        migration = importlib.import_module('detector.migrations.0002_detection_history')
+        expected = self.rollups()
+        domains = dict(DetectionResult.objects.values_list('id', 'input_domain'))
+        # Rows as they were before the migration: no domains and no rollups
+        DetectionResult.objects.update(input_domain='')
+        DetectionRollup.objects.all().delete()
+
+        # The backfill only needs the editor's connection
+        migration.backfill_history(apps, mock.Mock(connection=connection))
+        self.assertEqual(self.rollups(), expected)
+        self.assertEqual(dict(DetectionResult.objects.values_list('id', 'input_domain')), domains)
+        self.assertEqual(sorted(set(domains.values())), ['', 'a.com', 'b.org'])
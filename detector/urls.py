@@ -8,4 +8,7 @@ urlpatterns = [
     path('detect/', views.detect, name='detect'),
     path('results/<int:result_id>/', views.results, name='results'),
     path('trending/', views.trending_news, name='trending_news'),
+    path('admission/', views.admission_stats, name='admission_stats'),
+    path('history/', views.detection_history, name='detection_history'),
+    path('history/stats/', views.detection_stats, name='detection_stats'),
 ]
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import fcntl
+import random
+from contextlib import contextmanager
+from django.conf import settings
+
+
+class StageBusy(Exception):
+    """Raised when a stage is saturated and the request has been shed"""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"The {stage} stage is busy, retry in {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+def _stage_config(stage):
+    return settings.ADMISSION_LIMITS[stage]
+
+
+def _path(stage, name):
+    os.makedirs(settings.ADMISSION_DIR, exist_ok=True)
+    return os.path.join(settings.ADMISSION_DIR, f"{stage}.{name}")
+
+
+def _try_lock(path):
+    """
+    Take an exclusive flock on path without blocking
+    Returns the open file descriptor, or None if another holder has it.
+    The lock disappears with the holder, so a crashed worker never leaks a slot.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except BlockingIOError:
+        os.close(fd)
+        return None
+
+
+def _release(fd):
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def _try_slots(stage, kind, count):
+    """Try every slot of one kind, starting at a random one to spread contention"""
+    start = random.randrange(count) if count else 0
+    for i in range(count):
+        fd = _try_lock(_path(stage, f"{kind}{(start + i) % count}"))
+        if fd is not None:
+            return fd
+    return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_counters(path):
+    """The shared counters; a missing or unreadable file counts as empty"""
+    try:
+        with open(path) as f:
+            counters = json.loads(f.read() or '{}')
+    except (OSError, ValueError):
+        return {}
+    return counters if isinstance(counters, dict) else {}
+
+
+def _bump(stage, **deltas):
+    """
+    Update the counters shared by every worker
+    admitted and shed are running totals. in_flight and queued are gauges
+    kept per process, so a worker that dies mid-request drops out of them.
+    Writers take the stage's stats lock and replace the file atomically, so
+    readers never see a partial write. The counters are only for monitoring,
+    so failing to update them never fails the request.
+    """
+    pid = str(os.getpid())
+    path = _path(stage, 'stats')
+    try:
+        with open(_path(stage, 'stats.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                counters = _read_counters(path)
+                gauges = {
+                    other: gauge for other, gauge in counters.get('gauges', {}).items()
+                    if other == pid or _pid_alive(int(other))
+                }
+                counters['gauges'] = gauges
+                own = gauges.setdefault(pid, {'in_flight': 0, 'queued': 0})
+                for key, delta in deltas.items():
+                    if key in own:
+                        own[key] += delta
+                    else:
+                        counters[key] = counters.get(key, 0) + delta
+                if not any(own.values()):
+                    del gauges[pid]
+
+                tmp_path = f"{path}.{pid}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(json.dumps(counters))
+                os.replace(tmp_path, path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    except (OSError, ValueError) as e:
+        print(f"Error updating {stage} admission counters: {str(e)}")
+
+
+def _bump_holding(fd, stage, **deltas):
+    """Update the counters while holding fd, letting go of it if that fails"""
+    try:
+        _bump(stage, **deltas)
+    except BaseException:
+        _release(fd)
+        raise
+
+
+def acquire(stage):
+    """
+    Take one of the stage's concurrency slots
+    Waits in the stage's bounded queue for up to its timeout; raises
+    StageBusy straight away when the queue is full, or once the wait runs out.
+    Returns a token to hand back to release().
+    """
+    config = _stage_config(stage)
+
+    fd = _try_slots(stage, 'slot', config['concurrency'])
+    if fd is not None:
+        _bump_holding(fd, stage, admitted=1, in_flight=1)
+        return stage, fd
+
+    # All slots are busy, so join the queue if there is room left in it
+    wait_fd = _try_slots(stage, 'wait', config['queue'])
+    if wait_fd is None:
+        _bump(stage, shed=1)
+        raise StageBusy(stage, config['retry_after'])
+
+    fd = None
+    try:
+        _bump(stage, queued=1)
+        deadline = time.monotonic() + config['timeout']
+        delay = 0.01
+        while fd is None and time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+            fd = _try_slots(stage, 'slot', config['concurrency'])
+    except BaseException:
+        if fd is not None:
+            _release(fd)
+        _bump(stage, queued=-1)
+        raise
+    finally:
+        _release(wait_fd)
+
+    if fd is None:
+        _bump(stage, queued=-1, shed=1)
+        raise StageBusy(stage, config['retry_after'])
+    _bump_holding(fd, stage, queued=-1, admitted=1, in_flight=1)
+    return stage, fd
+
+
+def release(token):
+    """Give a slot taken by acquire() back"""
+    stage, fd = token
+    _release(fd)
+    _bump(stage, in_flight=-1)
+
+
+@contextmanager
+def admit(stage):
+    """Run the enclosed block while holding one of the stage's slots"""
+    token = acquire(stage)
+    try:
+        yield
+    finally:
+        release(token)
+
+
+def get_stats():
+    """
+    Current load for every stage, for capacity planning
+    in_flight and queued are live gauges; admitted and shed are totals.
+    Reads the shared counters only, so polling never takes a slot lock.
+    """
+    stats = {}
+    for stage, config in settings.ADMISSION_LIMITS.items():
+        # The file is replaced atomically, so it can be read without the lock
+        counters = _read_counters(_path(stage, 'stats'))
+
+        # Only count processes that are still running
+        live = [
+            gauge for pid, gauge in counters.get('gauges', {}).items()
+            if _pid_alive(int(pid))
+        ]
+        stats[stage] = {
+            'concurrency': config['concurrency'],
+            'queue_size': config['queue'],
+            'in_flight': sum(gauge['in_flight'] for gauge in live),
+            'queued': sum(gauge['queued'] for gauge in live),
+            'admitted': counters.get('admitted', 0),
+            'shed': counters.get('shed', 0),
+        }
+    return stats
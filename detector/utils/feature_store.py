@@ -0,0 +1,363 @@
+import os
+import time
+import fcntl
+import shutil
+import hashlib
+import numpy as np
+from contextlib import contextmanager
+from scipy import sparse
+from django.conf import settings
+
+from . import ml_model
+
+# Segments opened in this process, keyed by their directory path
+_segments = {}
+_version_cache = (None, None)
+
+# Runs of this many newer segments, each under SMALL_SEGMENT_ROWS rows, get merged
+SMALL_SEGMENT_ROWS = 1000
+MAX_SMALL_SEGMENTS = 32
+
+
+def vectorizer_version():
+    """
+    Fingerprint of the loaded vectorizer's vocabulary and idf weights
+    Stored vectors are only valid for the vectorizer that produced them.
+    """
+    global _version_cache
+
+    if ml_model.vectorizer is None:
+        ml_model.init_model()
+    vectorizer = ml_model.vectorizer
+    if _version_cache[0] is vectorizer:
+        return _version_cache[1]
+
+    digest = hashlib.sha1()
+    for word, index in sorted(vectorizer.vocabulary_.items()):
+        digest.update(f"{word}:{index};".encode('utf-8'))
+    idf = getattr(vectorizer, 'idf_', None)
+    if idf is not None:
+        digest.update(np.asarray(idf, dtype=np.float64).tobytes())
+    digest.update(repr(sorted(vectorizer.get_params().items(), key=lambda item: item[0])).encode('utf-8'))
+
+    version = digest.hexdigest()[:16]
+    _version_cache = (vectorizer, version)
+    return version
+
+
+def store_dir():
+    """Directory holding the segments for the current vectorizer"""
+    return os.path.join(settings.FEATURE_STORE_PATH, vectorizer_version())
+
+
+def _segment_paths():
+    path = store_dir()
+    if not os.path.isdir(path):
+        return []
+    # Staging directories end in .tmp until they are renamed into place
+    paths = [
+        os.path.join(path, name)
+        for name in sorted(os.listdir(path))
+        if name.startswith('seg-') and not name.endswith('.tmp')
+    ]
+    # Let go of segments another process has merged away, so their files can be freed
+    for cached in set(_segments) - set(paths):
+        if os.path.dirname(cached) == path:
+            del _segments[cached]
+    return paths
+
+
+def _open_segment(path):
+    """
+    Memory-map a segment's ids, indptr, indices and data arrays
+    Returns None if the segment was removed by a compaction or is unreadable.
+    """
+    segment = _segments.get(path)
+    if segment is None:
+        try:
+            segment = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+                for name in ('ids', 'indptr', 'indices', 'data')
+            }
+        except (FileNotFoundError, ValueError):
+            return None
+        _segments[path] = segment
+    return segment
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_stale_staging():
+    """Delete staging directories left behind by writers that died mid-write"""
+    path = store_dir()
+    if not os.path.isdir(path):
+        return
+    for name in os.listdir(path):
+        if not name.endswith('.tmp'):
+            continue
+        # Staging directories are named <segment>.<pid>.tmp
+        try:
+            pid = int(name.rsplit('.', 2)[1])
+        except (IndexError, ValueError):
+            pid = None
+        if pid is None or not _pid_alive(pid):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def _gather_rows(segment, rows):
+    """Copy the given rows of a segment out as (indptr, indices, data)"""
+    indptr = segment['indptr']
+    starts = np.asarray(indptr[rows], dtype=np.int64)
+    lengths = np.asarray(indptr[rows + 1], dtype=np.int64) - starts
+
+    out_indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=out_indptr[1:])
+    # Position of every stored value in the segment's flat arrays
+    positions = np.repeat(starts - out_indptr[:-1], lengths) + np.arange(out_indptr[-1])
+    return out_indptr, segment['indices'][positions], segment['data'][positions]
+
+
+def _write_arrays(path, ids, indptr, indices, data):
+    """Write a segment to a temporary directory, then move it into place"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    np.save(os.path.join(tmp_path, 'ids.npy'), np.asarray(ids, dtype=np.int64))
+    np.save(os.path.join(tmp_path, 'indptr.npy'), np.asarray(indptr, dtype=np.int64))
+    np.save(os.path.join(tmp_path, 'indices.npy'), np.asarray(indices, dtype=np.int32))
+    np.save(os.path.join(tmp_path, 'data.npy'), np.asarray(data, dtype=np.float32))
+    os.rename(tmp_path, path)
+
+
+def _new_segment_path():
+    return os.path.join(store_dir(), f"seg-{time.time_ns():020d}-{os.getpid()}")
+
+
+def save_features(result_ids, X):
+    """
+    Append TF-IDF rows for the given DetectionResult ids as a new segment
+    Rows are stored sorted by id so lookups can binary-search them. Once
+    enough small segments pile up they are merged, unless another process
+    is already compacting.
+    """
+    if not len(result_ids):
+        return
+    result_ids = np.asarray(result_ids, dtype=np.int64)
+    order = np.argsort(result_ids, kind='stable')
+    X = sparse.csr_matrix(X)[order]
+    X.sort_indices()
+    _write_arrays(_new_segment_path(), result_ids[order], X.indptr, X.indices, X.data)
+    compact(small_only=True, blocking=False)
+
+
+def stored_ids():
+    """Every DetectionResult id with stored features, as a sorted array"""
+    segments = [_open_segment(path) for path in _segment_paths()]
+    ids = [np.asarray(segment['ids']) for segment in segments if segment is not None]
+    if not ids:
+        return np.array([], dtype=np.int64)
+    return np.unique(np.concatenate(ids))
+
+
+def load_features(result_ids):
+    """
+    Read stored TF-IDF rows for the given DetectionResult ids
+    Returns: (X, found) where X has one row per id (empty when not stored)
+    and found is a boolean mask of the ids that were in the store
+    """
+    result_ids = np.asarray(result_ids, dtype=np.int64)
+    n_features = len(ml_model.vectorizer.vocabulary_)
+    found = np.zeros(len(result_ids), dtype=bool)
+    targets, blocks = [], []
+
+    # Newer segments win when an id has been stored more than once
+    for path in reversed(_segment_paths()):
+        if found.all():
+            break
+        segment = _open_segment(path)
+        if segment is None:
+            continue
+        ids = segment['ids']
+        wanted = np.where(~found)[0]
+        positions = np.minimum(np.searchsorted(ids, result_ids[wanted]), len(ids) - 1)
+        hits = ids[positions] == result_ids[wanted]
+        if not hits.any():
+            continue
+        indptr, indices, data = _gather_rows(segment, positions[hits])
+        blocks.append(sparse.csr_matrix((data, indices, indptr), shape=(int(hits.sum()), n_features)))
+        targets.append(wanted[hits])
+        found[wanted[hits]] = True
+
+    # Ids that were not found get empty rows, then everything goes back into request order
+    missing = np.where(~found)[0]
+    blocks.append(sparse.csr_matrix((len(missing), n_features), dtype=np.float32))
+    targets.append(missing)
+    X = sparse.vstack(blocks, format='csr')
+    X = X[np.argsort(np.concatenate(targets), kind='stable')]
+    return X, found
+
+
+def iter_features(chunk_size=10000):
+    """
+    Stream every stored row as (ids, X) chunks straight from the memory-mapped
+    segments, for batch re-scoring or training without touching input_text
+    """
+    n_features = len(ml_model.vectorizer.vocabulary_)
+    paths = _segment_paths()
+    newer_ids = np.array([], dtype=np.int64)
+    for path in reversed(paths):
+        segment = _open_segment(path)
+        if segment is None:
+            continue
+        ids = np.asarray(segment['ids'])
+        keep = np.where(~np.isin(ids, newer_ids))[0]
+        for start in range(0, len(keep), chunk_size):
+            rows = keep[start:start + chunk_size]
+            indptr, indices, data = _gather_rows(segment, rows)
+            yield ids[rows], sparse.csr_matrix(
+                (data, indices, indptr), shape=(len(rows), n_features)
+            )
+        newer_ids = np.union1d(newer_ids, ids)
+
+
+def load_training_data():
+    """Stored features with each result's verdict as the label"""
+    from detector.models import DetectionResult
+
+    matrices, labels = [], []
+    for ids, X in iter_features():
+        verdicts = dict(DetectionResult.objects.filter(id__in=ids.tolist()).values_list('id', 'is_fake'))
+        # Results deleted since their features were stored are left out
+        keep = np.array([int(i) in verdicts for i in ids], dtype=bool)
+        matrices.append(X[keep])
+        labels.extend(int(verdicts[int(i)]) for i in ids[keep])
+    if not matrices:
+        return sparse.csr_matrix((0, len(ml_model.vectorizer.vocabulary_))), np.array([])
+
+    return sparse.vstack(matrices, format='csr'), np.array(labels)
+
+
+@contextmanager
+def _compaction_lock(blocking):
+    """
+    Hold the store's compaction lock; yields False if it is taken and
+    blocking is off. The lock disappears with its holder, like admission slots.
+    """
+    path = store_dir()
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'compact.lock'), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _small_segment_run(paths):
+    """The newest segments that are each under SMALL_SEGMENT_ROWS rows"""
+    run = []
+    for path in reversed(paths):
+        segment = _open_segment(path)
+        if segment is not None and len(segment['ids']) >= SMALL_SEGMENT_ROWS:
+            break
+        run.append(path)
+    return run[::-1]
+
+
+def compact(small_only=False, blocking=True):
+    """
+    Merge segments into one, dropping rows superseded by newer segments
+    Streams rows into memory-mapped output arrays, so memory stays flat.
+    With small_only, only a run of at least MAX_SMALL_SEGMENTS small newest
+    segments is merged, so appends from single detections stay cheap.
+    """
+    with _compaction_lock(blocking) as locked:
+        if locked:
+            remove_stale_staging()
+            paths = _segment_paths()
+            if small_only:
+                paths = _small_segment_run(paths)
+                if len(paths) < MAX_SMALL_SEGMENTS:
+                    return
+            _merge(paths)
+
+
+def _merge(paths):
+    if len(paths) < 2:
+        return
+
+    # Work out which rows survive and how big the merged arrays are
+    plan, merged = [], []
+    newer_ids = np.array([], dtype=np.int64)
+    total_rows = total_values = 0
+    for path in reversed(paths):
+        segment = _open_segment(path)
+        if segment is None:
+            continue
+        ids = np.asarray(segment['ids'])
+        keep = np.where(~np.isin(ids, newer_ids))[0]
+        lengths = np.diff(np.asarray(segment['indptr']))[keep]
+        plan.append((segment, ids[keep], keep, lengths))
+        merged.append(path)
+        total_rows += len(keep)
+        total_values += int(lengths.sum())
+        newer_ids = np.union1d(newer_ids, ids)
+    if not plan:
+        return
+
+    all_ids = np.concatenate([ids for _, ids, _, _ in plan])
+    order = np.argsort(all_ids, kind='stable')
+    sources = np.concatenate([np.full(len(ids), i) for i, (_, ids, _, _) in enumerate(plan)])
+    rows = np.concatenate([keep for _, _, keep, _ in plan])
+    lengths = np.concatenate([lengths for _, _, _, lengths in plan])
+
+    # Named after the newest source, so segments written meanwhile still sort after it
+    merged_path = f"{paths[-1]}-m"
+    tmp_path = f"{merged_path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    np.save(os.path.join(tmp_path, 'ids.npy'), all_ids[order])
+    indptr = np.zeros(total_rows + 1, dtype=np.int64)
+    np.cumsum(lengths[order], out=indptr[1:])
+    np.save(os.path.join(tmp_path, 'indptr.npy'), indptr)
+
+    indices = np.lib.format.open_memmap(
+        os.path.join(tmp_path, 'indices.npy'), mode='w+', dtype=np.int32, shape=(total_values,))
+    data = np.lib.format.open_memmap(
+        os.path.join(tmp_path, 'data.npy'), mode='w+', dtype=np.float32, shape=(total_values,))
+
+    # Copy rows across in id order, one source segment at a time per block
+    block = 10000
+    for start in range(0, total_rows, block):
+        block_order = order[start:start + block]
+        offset = indptr[start]
+        block_indptr = indptr[start:start + len(block_order) + 1] - offset
+        for source in np.unique(sources[block_order]):
+            mask = sources[block_order] == source
+            segment = plan[source][0]
+            src_indptr, src_indices, src_data = _gather_rows(segment, rows[block_order[mask]])
+            targets = np.where(mask)[0]
+            dest_starts = block_indptr[targets] + offset
+            src_lengths = np.diff(src_indptr)
+            positions = np.repeat(dest_starts - src_indptr[:-1], src_lengths) + np.arange(src_indptr[-1])
+            indices[positions] = src_indices
+            data[positions] = src_data
+    indices.flush()
+    data.flush()
+    del indices, data
+    os.rename(tmp_path, merged_path)
+
+    for path in merged:
+        _segments.pop(path, None)
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,93 @@
+import base64
+from datetime import datetime, timedelta
+from django.db.models import Sum
+from django.utils import timezone
+
+from detector.models import DetectionResult, DetectionRollup, url_domain
+
+# Columns returned by the history API; input_text is deliberately left out
+HISTORY_FIELDS = (
+    'id', 'created_at', 'is_fake', 'confidence_score',
+    'ml_prediction', 'openai_prediction', 'input_url', 'input_domain',
+)
+
+
+def encode_cursor(created_at, result_id):
+    """Opaque cursor pointing just after the given row"""
+    raw = f"{created_at.isoformat()}|{result_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into (created_at, id); raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, result_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(result_id)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def history_queryset(cursor=None, is_fake=None, domain=None, using=None):
+    """
+    Detections newest first, ordered by (created_at, id) so every filter
+    combination is served by one of DetectionResult's composite indexes
+    """
+    queryset = DetectionResult.objects.using(using).order_by('-created_at', '-id')
+    if is_fake is not None:
+        queryset = queryset.filter(is_fake=is_fake)
+    if domain:
+        queryset = queryset.filter(input_domain=url_domain(f"//{domain}") or domain)
+    if cursor:
+        created_at, result_id = decode_cursor(cursor)
+        # Written as a range plus an exclusion so the index can seek to the cursor
+        queryset = queryset.filter(created_at__lte=created_at).exclude(
+            created_at=created_at, id__gte=result_id
+        )
+    return queryset.values(*HISTORY_FIELDS)
+
+
+def get_history_page(limit=50, cursor=None, is_fake=None, domain=None, using=None):
+    """
+    One page of history
+    Returns: (rows, next_cursor) where next_cursor is None on the last page
+    """
+    rows = list(history_queryset(cursor, is_fake, domain, using)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return rows, next_cursor
+
+
+def get_hourly_stats(start=None, end=None, using=None):
+    """
+    Hourly totals and fake rates between start and end (default: last 24 hours),
+    read from the rollup counters rather than the detections table
+    """
+    end = end or timezone.now()
+    start = start or end - timedelta(hours=24)
+    # Include the bucket that start falls in
+    start = start.replace(minute=0, second=0, microsecond=0)
+    rollups = DetectionRollup.objects.using(using).filter(hour__gte=start, hour__lte=end)
+
+    buckets = [
+        {
+            'hour': hour,
+            'total': total,
+            'fake': fake,
+            'fake_rate': fake / total if total else 0.0,
+        }
+        for hour, total, fake in rollups.order_by('hour').values_list('hour', 'total', 'fake')
+    ]
+    totals = rollups.aggregate(total=Sum('total'), fake=Sum('fake'))
+    total = totals['total'] or 0
+    fake = totals['fake'] or 0
+    return {
+        'start': start,
+        'end': end,
+        'total': total,
+        'fake': fake,
+        'fake_rate': fake / total if total else 0.0,
+        'hourly': buckets,
+    }
@@ -2,7 +2,11 @@ import os
 import re
 import pandas as pd
 import pickle
+import time
+import hashlib
+import numpy as np
 import nltk
+from scipy import sparse
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
@@ -14,6 +18,13 @@ from django.conf import settings
 vectorizer = None
 model = None
 
+# Per-tree attribution tables, rebuilt whenever the model is loaded
+node_deltas = []
+base_value = 0.0
+feature_names = None
+# Fingerprint of the loaded forest, identical in every worker that loaded the same model
+model_version = None
+
 def create_fallback_model():
     """Create a simple fallback model when the main training process fails"""
     global vectorizer, model
@@ -90,6 +101,8 @@ def init_model():
         # Create a basic fallback model
         print("Creating a basic fallback model...")
         create_fallback_model()
+    
+    build_attribution()
 
 def preprocess_text(text):
     """Clean and preprocess text for machine learning"""
@@ -122,10 +135,30 @@ def preprocess_text(text):
     
     return ' '.join(tokens)
 
-def train_model():
-    """Train the machine learning model using the provided datasets"""
+def train_model(from_feature_store=False):
+    """
+    Train the machine learning model using the provided datasets
+    With from_feature_store, only the classifier is refit, on the stored
+    vectors of past detections labelled with their verdicts. The vectorizer
+    is kept, so the stored vectors stay valid.
+    """
     global vectorizer, model
     
+    if from_feature_store:
+        from . import feature_store
+        
+        X, y = feature_store.load_training_data()
+        if len(np.unique(y)) < 2:
+            raise ValueError("The feature store needs both fake and real results to train on")
+        
+        model = RandomForestClassifier(n_estimators=100, random_state=42)
+        model.fit(X, y)
+        
+        with open(os.path.join(settings.ML_MODEL_PATH, 'fake_news_model.pkl'), 'wb') as f:
+            pickle.dump(model, f)
+        build_attribution()
+        return
+    
     # Load and prepare datasets
     try:
         # Load the true news dataset
@@ -238,42 +271,192 @@ def predict(text):
     
     return is_fake, confidence
 
-def get_explanation(text):
-    """
-    Get explanation for the prediction 
-    Returns key factors that influenced the decision
-    """
+def transform_texts(texts):
+    """Preprocess a batch of texts and turn them into one sparse TF-IDF matrix"""
     global vectorizer, model
     
     if model is None or vectorizer is None:
         init_model()
     
-    # Preprocess the text
-    processed_text = preprocess_text(text)
+    processed_texts = [preprocess_text(text) for text in texts]
+    return vectorizer.transform(processed_texts)
+
+def predict_matrix(X):
+    """
+    Make predictions for an already vectorized batch
+    Returns: list of (is_fake, confidence) in row order
+    """
+    fake_index = list(model.classes_).index(1)
+    fake_probas = model.predict_proba(X)[:, fake_index]
+    
+    results = []
+    for fake_proba in fake_probas:
+        is_fake = bool(fake_proba > 0.5)
+        confidence = float(fake_proba if is_fake else 1 - fake_proba)
+        results.append((is_fake, confidence))
     
-    # Get feature importance
-    if not processed_text:
+    return results
+
+def predict_batch(texts):
+    """
+    Make predictions for a batch of texts in a single vectorizer/model pass
+    Returns: list of (is_fake, confidence) in input order
+    """
+    if not texts:
         return []
-        
-    # Extract words from the text
-    words = processed_text.split()
     
-    # Get feature names from the vectorizer
+    return predict_matrix(transform_texts(texts))
+
+def build_attribution():
+    """
+    Precompute per-node contribution tables for every tree in the forest
+    
+    Moving from a node to one of its children changes the tree's fake
+    probability by (child value - parent value); that delta is credited to
+    the feature the parent splits on. Each tree gets a sparse
+    (n_nodes x n_features) matrix of these deltas, already divided by the
+    number of trees, so a document's contributions are the sum over trees of
+    its decision path indicator times that matrix.
+    """
+    global node_deltas, base_value, feature_names, model_version
+    
+    if model is None or vectorizer is None:
+        return
+    
     try:
         feature_names = vectorizer.get_feature_names_out()
     except AttributeError:
         # For older versions of scikit-learn
-        feature_names = vectorizer.get_feature_names()
+        feature_names = np.array(vectorizer.get_feature_names())
+    
+    fake_index = list(model.classes_).index(1)
+    n_trees = len(model.estimators_)
+    n_features = model.n_features_in_
+    
+    deltas = []
+    bias = 0.0
+    digest = hashlib.sha1()
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        for array in (tree.children_left, tree.feature, tree.threshold, tree.value):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        # Normalise so raw counts (older scikit-learn) and fractions both work
+        values = tree.value[:, 0, :]
+        fake_values = values[:, fake_index] / values.sum(axis=1)
+        
+        parents = np.full(tree.node_count, -1)
+        internal = np.where(tree.children_left != -1)[0]
+        parents[tree.children_left[internal]] = internal
+        parents[tree.children_right[internal]] = internal
+        
+        children = np.where(parents >= 0)[0]
+        split_features = tree.feature[parents[children]]
+        data = (fake_values[children] - fake_values[parents[children]]) / n_trees
+        
+        deltas.append(sparse.csr_matrix(
+            (data, (children, split_features)),
+            shape=(tree.node_count, n_features)
+        ))
+        bias += fake_values[0] / n_trees
+    
+    node_deltas = deltas
+    base_value = float(bias)
+    model_version = digest.hexdigest()[:16]
+
+def attribute_matrix(X, budget_ms=None):
+    """
+    Signed contribution of every feature to each row's fake probability
+    
+    Walks the decision paths tree by tree. With budget_ms, stops once the
+    budget is spent and rescales by the number of trees actually visited;
+    without it every tree is used, and each row's contributions plus
+    base_value add up to its predicted fake probability.
+    Returns: (contributions, complete) where contributions is a sparse
+    (n_rows x n_features) matrix and complete is False if the budget cut it short
+    """
+    if not node_deltas:
+        build_attribution()
+    
+    deadline = None
+    if budget_ms is not None:
+        deadline = time.perf_counter() + budget_ms / 1000.0
+    
+    X = sparse.csr_matrix(X, dtype=np.float32)
+    contributions = sparse.csr_matrix(X.shape, dtype=np.float64)
+    trees_used = 0
+    for estimator, deltas in zip(model.estimators_, node_deltas):
+        path = estimator.decision_path(X, check_input=False)
+        contributions = contributions + path @ deltas
+        trees_used += 1
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+    
+    complete = trees_used == len(node_deltas)
+    if not complete:
+        contributions = contributions * (len(node_deltas) / trees_used)
     
-    # Get feature importances from the model
-    importances = model.feature_importances_
+    return sparse.csr_matrix(contributions), complete
+
+def explain_matrix(X, top_k=5, budget_ms=None, return_complete=False):
+    """
+    Per-document explanations for an already vectorized batch
+    
+    budget_ms is a latency budget for the whole batch; by default there is
+    none and the explanations are exact (see attribute_matrix).
+    Returns: one list of (word, contribution) per row, where contribution is
+    the signed change in fake probability in percentage points. With
+    return_complete, returns (explanations, complete) instead.
+    """
+    contributions, complete = attribute_matrix(X, budget_ms)
     
-    # Match words in the text to feature importances
-    word_importances = []
-    for word in set(words):
-        if word in feature_names:
-            idx = list(feature_names).index(word)
-            word_importances.append((word, importances[idx]))
+    # Only words that actually appear in each document are reported
+    contributions = sparse.csr_matrix(contributions.multiply(sparse.csr_matrix(X) != 0))
+    
+    explanations = []
+    for row in range(contributions.shape[0]):
+        start, end = contributions.indptr[row], contributions.indptr[row + 1]
+        indices = contributions.indices[start:end]
+        values = contributions.data[start:end]
+        order = np.argsort(-np.abs(values))[:top_k]
+        explanations.append([
+            (str(feature_names[indices[i]]), float(values[i] * 100))
+            for i in order
+            if values[i] != 0
+        ])
+    
+    if return_complete:
+        return explanations, complete
+    return explanations
+
+def explain_batch(texts, top_k=5, budget_ms=None):
+    """
+    Get per-document explanations for a batch of texts
+    Returns: one list of signed (word, contribution) pairs per text
+    """
+    if not texts:
+        return []
+    
+    return explain_matrix(transform_texts(texts), top_k=top_k, budget_ms=budget_ms)
+
+def get_explanation(text, result_id=None):
+    """
+    Get explanation for the prediction 
+    Returns the words in this text that pushed the decision the most, as
+    (word, contribution) pairs; positive contributions point towards fake
+    Stored features are used when result_id is in the feature store.
+    Runs within the ML_EXPLANATION_BUDGET_MS latency budget.
+    Returns: (explanation, complete) where complete is False if the budget
+    ran out and the contributions were estimated from a subset of the trees
+    """
+    budget_ms = getattr(settings, 'ML_EXPLANATION_BUDGET_MS', 200)
+    X = None
+    if result_id is not None:
+        from . import feature_store
+        X, found = feature_store.load_features([result_id])
+        if not found[0]:
+            X = None
+    if X is None:
+        X = transform_texts([text])
     
-    # Return top 5 most important words that appear in the text
-    return sorted(word_importances, key=lambda x: x[1], reverse=True)[:5]
+    explanations, complete = explain_matrix(X, budget_ms=budget_ms, return_complete=True)
+    return explanations[0], complete
@@ -0,0 +1,271 @@
+import os
+import time
+import zlib
+import pickle
+import sqlite3
+import threading
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+# Values larger than this are compressed before they are stored
+COMPRESS_MIN_SIZE = 1024
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache backend shared by every worker process on the host
+
+    Entries live in a single SQLite database in WAL mode, so readers never
+    block each other and a restarted worker starts with a warm cache. Values
+    are pickled (and zlib-compressed when large), have per-entry expiry times,
+    and the oldest entries are evicted once MAX_ENTRIES or MAX_SIZE (bytes)
+    is exceeded.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = os.path.abspath(location)
+        options = params.get('OPTIONS', {})
+        self._max_size = options.get('MAX_SIZE')
+        self._local = threading.local()
+
+    def _connection(self):
+        """One connection per thread, reopened after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        conn = sqlite3.connect(self._path, timeout=5, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        # REPLACE only fires the delete trigger with recursive triggers on
+        conn.execute('PRAGMA recursive_triggers=ON')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, compressed INTEGER NOT NULL, '
+                'size INTEGER NOT NULL, expires REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+            # Running entry count and byte total, kept in step with cache by triggers
+            # so culling never has to scan the table
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_meta ('
+                'id INTEGER PRIMARY KEY CHECK (id = 1), count INTEGER NOT NULL, size INTEGER NOT NULL)'
+            )
+            conn.execute(
+                'INSERT OR IGNORE INTO cache_meta (id, count, size) '
+                'SELECT 1, COUNT(*), TOTAL(size) FROM cache'
+            )
+            conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_meta_insert AFTER INSERT ON cache BEGIN '
+                'UPDATE cache_meta SET count = count + 1, size = size + NEW.size; END'
+            )
+            conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_meta_delete AFTER DELETE ON cache BEGIN '
+                'UPDATE cache_meta SET count = count - 1, size = size - OLD.size; END'
+            )
+            conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_meta_update AFTER UPDATE OF size ON cache BEGIN '
+                'UPDATE cache_meta SET size = size - OLD.size + NEW.size; END'
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _dumps(self, value):
+        data = pickle.dumps(value, self.pickle_protocol)
+        if len(data) >= COMPRESS_MIN_SIZE:
+            compressed = zlib.compress(data, 1)
+            if len(compressed) < len(data):
+                return compressed, 1
+        return data, 0
+
+    def _loads(self, data, compressed):
+        if compressed:
+            data = zlib.decompress(data)
+        return pickle.loads(data)
+
+    def _write(self, conn, key, data, compressed, timeout):
+        # REPLACE gives the row a fresh rowid, so rowid order is write order
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, compressed, size, expires) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (key, data, compressed, len(data), self.get_backend_timeout(timeout))
+        )
+
+    def _too_large(self, data):
+        """A value bigger than MAX_SIZE would evict everything and still not fit"""
+        return self._max_size is not None and len(data) > self._max_size
+
+    def _cull(self, conn, incoming=0):
+        """Drop expired entries, then the oldest ones until the limits hold"""
+        count, size = conn.execute('SELECT count, size FROM cache_meta').fetchone()
+        over_entries = count > self._max_entries
+        over_size = self._max_size is not None and size + incoming > self._max_size
+        if not over_entries and not over_size:
+            return
+
+        conn.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+        if over_entries:
+            count = conn.execute('SELECT count FROM cache_meta').fetchone()[0]
+            if count > self._max_entries:
+                if self._cull_frequency == 0:
+                    conn.execute('DELETE FROM cache')
+                    return
+                conn.execute(
+                    'DELETE FROM cache WHERE rowid IN '
+                    '(SELECT rowid FROM cache ORDER BY rowid LIMIT ?)',
+                    (count // self._cull_frequency,)
+                )
+        if self._max_size is not None:
+            conn.execute(
+                'DELETE FROM cache WHERE rowid IN (SELECT rowid FROM '
+                '(SELECT rowid, SUM(size) OVER (ORDER BY rowid DESC) AS running FROM cache) '
+                'WHERE running > ?)',
+                (self._max_size - incoming,)
+            )
+
+    def _fetch(self, conn, key):
+        row = conn.execute(
+            'SELECT value, compressed, expires FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[2] is not None and row[2] < time.time():
+            conn.execute('DELETE FROM cache WHERE key = ? AND expires = ?', (key, row[2]))
+            return None
+        return row
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._fetch(self._connection(), key)
+        if row is None:
+            return default
+        return self._loads(row[0], row[1])
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        conn = self._connection()
+        placeholders = ', '.join('?' * len(key_map))
+        rows = conn.execute(
+            f'SELECT key, value, compressed, expires FROM cache WHERE key IN ({placeholders})',
+            list(key_map)
+        ).fetchall()
+        now = time.time()
+        return {
+            key_map[key]: self._loads(value, compressed)
+            for key, value, compressed, expires in rows
+            if expires is None or expires >= now
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        data, compressed = self._dumps(value)
+        conn = self._connection()
+        if self._too_large(data):
+            # Never stored, and the old value must not be served in its place
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._cull(conn, len(data))
+            self._write(conn, key, data, compressed, timeout)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        entries, failed = [], []
+        for original_key, value in data.items():
+            key = self.make_and_validate_key(original_key, version=version)
+            value, compressed = self._dumps(value)
+            if self._too_large(value):
+                failed.append(original_key)
+                self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+            else:
+                entries.append((key, value, compressed))
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._cull(conn, sum(len(entry[1]) for entry in entries))
+            for key, value, compressed in entries:
+                self._write(conn, key, value, compressed, timeout)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        data, compressed = self._dumps(value)
+        if self._too_large(data):
+            return False
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self._fetch(conn, key) is not None:
+                conn.execute('COMMIT')
+                return False
+            self._cull(conn, len(data))
+            self._write(conn, key, data, compressed, timeout)
+            conn.execute('COMMIT')
+            return True
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._fetch(conn, key)
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._loads(row[0], row[1]) + delta
+            data, compressed = self._dumps(value)
+            conn.execute(
+                'UPDATE cache SET value = ?, compressed = ?, size = ? WHERE key = ?',
+                (data, compressed, len(data), key)
+            )
+            conn.execute('COMMIT')
+            return value
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires >= ?)',
+            (self.get_backend_timeout(timeout), key, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._fetch(self._connection(), key) is not None
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Connections are kept open for the life of the thread
+        pass
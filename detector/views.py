@@ -1,11 +1,22 @@
 import json
+from datetime import timedelta
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 
 from .models import DetectionResult
-from .utils import ml_model, web_scraper, openai_helper, news_api
+from .utils import ml_model, web_scraper, openai_helper, news_api, admission, history, feature_store
+
+def busy_response(busy):
+    """Tell the client a stage is saturated and when to try again"""
+    response = JsonResponse({
+        'error': 'The service is busy right now. Please try again shortly.'
+    }, status=503)
+    response['Retry-After'] = str(busy.retry_after)
+    return response
 
 def index(request):
     """Home page view with form for text/URL input"""
@@ -28,7 +39,8 @@ def detect(request):
         if news_url:
             try:
                 # Scrape the content from the URL
-                scraped_text = web_scraper.get_website_text(news_url)
+                with admission.admit('scrape'):
+                    scraped_text = web_scraper.get_website_text(news_url)
                 
                 if not scraped_text:
                     return JsonResponse({
@@ -36,13 +48,21 @@ def detect(request):
                     }, status=400)
                 
                 # Use the scraped text for ML prediction
-                ml_prediction, ml_confidence = ml_model.predict(scraped_text)
+                with admission.admit('ml'):
+                    features = ml_model.transform_texts([scraped_text])
+                    ml_prediction, ml_confidence = ml_model.predict_matrix(features)[0]
                 
                 # If OpenAI API key is available, use it for additional analysis
                 if settings.OPENAI_API_KEY:
-                    using_openai = True
-                    openai_prediction, openai_confidence = openai_helper.analyze_text(scraped_text)
-                    
+                    try:
+                        with admission.admit('openai'):
+                            openai_prediction, openai_confidence = openai_helper.analyze_text(scraped_text)
+                            using_openai = True
+                    except admission.StageBusy:
+                        # OpenAI is saturated, so settle for the ML-only verdict
+                        pass
+                
+                if using_openai:
                     # Combine predictions (weighted average)
                     is_fake = ml_prediction if ml_confidence > openai_confidence else openai_prediction
                     confidence_score = max(ml_confidence, openai_confidence)
@@ -51,6 +71,8 @@ def detect(request):
                     confidence_score = ml_confidence
                     openai_prediction = None
                     
+            except admission.StageBusy as busy:
+                return busy_response(busy)
             except Exception as e:
                 return JsonResponse({
                     'error': f'Error processing URL: {str(e)}'
@@ -58,7 +80,12 @@ def detect(request):
         
         elif news_text:
             # Use ML model for text prediction
-            ml_prediction, ml_confidence = ml_model.predict(news_text)
+            try:
+                with admission.admit('ml'):
+                    features = ml_model.transform_texts([news_text])
+                    ml_prediction, ml_confidence = ml_model.predict_matrix(features)[0]
+            except admission.StageBusy as busy:
+                return busy_response(busy)
             is_fake = ml_prediction
             confidence_score = ml_confidence
             openai_prediction = None
@@ -78,6 +105,12 @@ def detect(request):
             openai_prediction=openai_prediction
         )
         
+        # Keep the vector so explanations and rescoring can skip preprocessing
+        try:
+            feature_store.save_features([result.id], features)
+        except Exception as e:
+            print(f"Error saving features: {str(e)}")
+        
         # Return result ID for redirect
         return JsonResponse({
             'result_id': result.id
@@ -90,12 +123,24 @@ def results(request, result_id):
     result = get_object_or_404(DetectionResult, id=result_id)
     trending = news_api.get_trending_news()
     
-    # Get explanation factors
-    explanation = ml_model.get_explanation(result.input_text)
+    # Get explanation factors, skipping them if the ML stage is saturated.
+    # The key names the model and vectorizer, so a retrained model never serves old factors.
+    cache_key = f'explanation:{feature_store.vectorizer_version()}:{ml_model.model_version}:{result.id}'
+    cached = cache.get(cache_key)
+    if cached is not None:
+        explanation, explanation_complete = cached
+    else:
+        try:
+            with admission.admit('ml'):
+                explanation, explanation_complete = ml_model.get_explanation(result.input_text, result.id)
+            cache.set(cache_key, (explanation, explanation_complete), 60 * 60)
+        except admission.StageBusy:
+            explanation, explanation_complete = [], True
     
     return render(request, 'detector/results.html', {
         'result': result,
         'explanation': explanation,
+        'explanation_complete': explanation_complete,
         'trending': trending
     })
 
@@ -103,3 +148,43 @@ def trending_news(request):
     """API endpoint to get trending news"""
     trending = news_api.get_trending_news()
     return JsonResponse({'trending': trending})
+
+def admission_stats(request):
+    """API endpoint exposing per-stage load for capacity planning"""
+    return JsonResponse({'stages': admission.get_stats()})
+
+def detection_history(request):
+    """API endpoint listing recent detections, newest first, with cursor pagination"""
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), 500)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+    
+    is_fake = request.GET.get('is_fake')
+    if is_fake is not None:
+        if is_fake.lower() not in ('true', 'false', '1', '0'):
+            return JsonResponse({'error': 'is_fake must be true or false'}, status=400)
+        is_fake = is_fake.lower() in ('true', '1')
+    
+    try:
+        rows, next_cursor = history.get_history_page(
+            limit=limit,
+            cursor=request.GET.get('cursor'),
+            is_fake=is_fake,
+            domain=request.GET.get('domain'),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({'results': rows, 'next_cursor': next_cursor})
+
+def detection_stats(request):
+    """API endpoint with hourly detection counts and fake rates"""
+    try:
+        hours = min(max(int(request.GET.get('hours', 24)), 1), 24 * 90)
+    except ValueError:
+        return JsonResponse({'error': 'hours must be an integer'}, status=400)
+    
+    end = timezone.now()
+    stats = history.get_hourly_stats(start=end - timedelta(hours=hours), end=end)
+    return JsonResponse(stats)
@@ -66,6 +66,19 @@ DATABASES = {
     }
 }
 
+# Cache shared by every worker on the host, so trending news and explanations
+# are fetched once and survive restarts
+CACHES = {
+    'default': {
+        'BACKEND': 'detector.utils.shared_cache.SQLiteCache',
+        'LOCATION': os.environ.get('CACHE_PATH', os.path.join(BASE_DIR, 'run', 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -108,3 +121,21 @@ NEWS_API_KEY = os.environ.get('NEWS_API_KEY', '')
 
 # Model settings
 ML_MODEL_PATH = os.path.join(BASE_DIR, 'detector', 'ml_model')
+
+# Time allowed for walking the forest when explaining a prediction (milliseconds)
+ML_EXPLANATION_BUDGET_MS = int(os.environ.get('ML_EXPLANATION_BUDGET_MS', '200'))
+
+# Stored TF-IDF vectors for DetectionResult rows, one subdirectory per vectorizer version
+FEATURE_STORE_PATH = os.environ.get('FEATURE_STORE_PATH', os.path.join(BASE_DIR, 'run', 'features'))
+
+# Admission control for the expensive detection stages, shared by every worker on the host.
+# concurrency: requests allowed in the stage at once
+# queue: requests allowed to wait for a slot; any more are shed straight away
+# timeout: seconds a queued request waits before it is shed
+# retry_after: seconds sent back in the Retry-After header when a request is shed
+ADMISSION_DIR = os.environ.get('ADMISSION_DIR', os.path.join(BASE_DIR, 'run', 'admission'))
+ADMISSION_LIMITS = {
+    'scrape': {'concurrency': 4, 'queue': 8, 'timeout': 5, 'retry_after': 10},
+    'openai': {'concurrency': 4, 'queue': 4, 'timeout': 2, 'retry_after': 10},
+    'ml': {'concurrency': 8, 'queue': 16, 'timeout': 5, 'retry_after': 5},
+}